@@ -1,10 +1,154 @@
+import io
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from statsmodels.tools.sm_exceptions import ConvergenceWarning
-import warnings
+import altair as alt
+
+
+# AutoETS only estimates an additive-trend model (alpha, beta, l0, b0) from more than 4 + 4 points
+MIN_ETS_POINTS = 9
+
+
+def forecast_holt(Y, horizon):
+    """Fit an additive-trend Exponential Smoothing model to each row of Y and forecast horizon steps ahead."""
+    # The additive-trend forecast is affine in the final (level, trend) state: level + trend * h
+    final_states = np.zeros((Y.shape[0], 2), dtype=np.float64)
+    if Y.shape[1] < MIN_ETS_POINTS:
+        # Too short for AutoETS: fall back to a least-squares linear trend through the history
+        steps = np.arange(Y.shape[1])
+        for i in range(Y.shape[0]):
+            trend, intercept = np.polyfit(steps, Y[i], 1)
+            final_states[i] = intercept + trend * steps[-1], trend
+        return final_states[:, :1] + final_states[:, 1:] * np.arange(1, horizon + 1)
+
+    # Imported here so the landing page doesn't pay statsforecast's (numba) import cost before any upload
+    from statsforecast.models import AutoETS
+
+    for i in range(Y.shape[0]):
+        model = AutoETS(model='AAN', damped=False, season_length=1).fit(Y[i]).model_
+        final_states[i, 0] = model['states'][-1, 0]
+        # A constant series makes AutoETS fall back to a no-trend model whose states hold only the level
+        if model['components'][1] == 'A':
+            final_states[i, 1] = model['states'][-1, 1]
+    return final_states[:, :1] + final_states[:, 1:] * np.arange(1, horizon + 1)
+
+
+@st.cache_data
+def load_materials(file_bytes):
+    """Parse the material names from the 'Solids' and 'Concentrates' sheets of the Materials DB workbook."""
+    materials_db = pd.ExcelFile(io.BytesIO(file_bytes), engine='calamine')
+    if 'Solids' not in materials_db.sheet_names or 'Concentrates' not in materials_db.sheet_names:
+        raise ValueError("Expected sheets 'Solids' and 'Concentrates' not found in the Materials DB file. Please check the file.")
+
+    # Only the material name column is needed; skip the sheet header rows and every other column
+    solids_materials = materials_db.parse('Solids', header=None, skiprows=4, usecols=lambda column: column == 1)
+    concentrates_materials = materials_db.parse('Concentrates', header=None, skiprows=3, usecols=lambda column: column == 2)
+    if solids_materials.shape[1] == 0:
+        raise ValueError("Expected material names in column B of the 'Solids' sheet. Please check the file.")
+    if concentrates_materials.shape[1] == 0:
+        raise ValueError("Expected material names in column C of the 'Concentrates' sheet. Please check the file.")
+
+    solids_materials = solids_materials.set_axis(['Material'], axis=1).dropna()
+    concentrates_materials = concentrates_materials.set_axis(['Material'], axis=1).dropna()
+    return solids_materials, concentrates_materials
+
+
+@st.cache_data
+def compute_diversity(materials_bytes):
+    """Summarize how many materials are unique to, and shared between, the Solids and Concentrates sheets."""
+    solids_materials, concentrates_materials = load_materials(materials_bytes)
+
+    # Analyze material diversity
+    solids_unique = pd.Index(solids_materials["Material"].unique())
+    concentrates_unique = pd.Index(concentrates_materials["Material"].unique())
+
+    solids_count = len(solids_unique)
+    concentrates_count = len(concentrates_unique)
+    all_materials_unique = len(solids_unique.union(concentrates_unique))
+
+    overlap_count = len(solids_unique.intersection(concentrates_unique))
+    unique_solids = solids_count - overlap_count
+    unique_concentrates = concentrates_count - overlap_count
+
+    material_diversity_summary = {
+        "Unique Materials (Solids)": solids_count,
+        "Unique Materials (Concentrates)": concentrates_count,
+        "Total Unique Materials (Combined)": all_materials_unique,
+        "Overlapping Materials": overlap_count,
+        "Unique to Solids": unique_solids,
+        "Unique to Concentrates": unique_concentrates,
+    }
+
+    return material_diversity_summary
+
+
+@st.cache_data
+def load_production(file_bytes):
+    """Parse the 'Production' sheet and return the cleaned production, material CO2 and plastics CO2 series."""
+    columns = ['TPM', 'MyBC growth CO2 Produced Tons (1,6 kg per ton)', 'Plastic encineration(2.9kg CO2 per kg)']
+    data = pd.ExcelFile(io.BytesIO(file_bytes), engine='calamine')
+    if 'Production' not in data.sheet_names:
+        raise ValueError("Expected sheet 'Production' not found in the Production Data file. Please check the file.")
+
+    production_data = data.parse(
+        'Production',
+        usecols=lambda column: column in ['Date'] + columns,
+        dtype={column: 'float64' for column in columns},
+    )
+    missing_columns = [column for column in ['Date'] + columns if column not in production_data.columns]
+    if missing_columns:
+        raise ValueError(
+            "Expected columns not found in the 'Production' sheet: " + ", ".join(missing_columns) + ". Please check the file."
+        )
+    production_data = production_data.set_index('Date')
+
+    # Date cells already come back as datetimes from calamine; only parse them when stored as text
+    if not isinstance(production_data.index, pd.DatetimeIndex):
+        production_data.index = pd.to_datetime(production_data.index)
+
+    # Prepare production and CO2 data: drop rows where any series is missing or infinite, keeping them aligned
+    clean = production_data[columns].replace([np.inf, -np.inf], np.nan).dropna(how='any')
+    production, co2_emissions, plastics_co2_emissions = clean[columns[0]], clean[columns[1]], clean[columns[2]]
+
+    return production, co2_emissions, plastics_co2_emissions
+
+
+@st.cache_data
+def fit_and_forecast(prod_bytes, horizon):
+    """Forecast production and CO2 emissions horizon months ahead and derive the reduction metrics."""
+    production, co2_emissions, plastics_co2_emissions = load_production(prod_bytes)
+    if len(production) < 2:
+        raise ValueError("At least two complete rows of production data are needed to forecast. Please check the file.")
+
+    # Monthly dates for the forecast horizon, starting the month after the last observation
+    future_dates = pd.date_range(production.index[-1] + pd.offsets.MonthBegin(1), periods=horizon, freq='MS')
+
+    # Fit the data with Exponential Smoothing (additive trend, no seasonality)
+    Y = np.vstack([
+        production.to_numpy(dtype=np.float64),
+        co2_emissions.to_numpy(dtype=np.float64),
+        plastics_co2_emissions.to_numpy(dtype=np.float64),
+    ])
+    # Fit in float64, then run the derived-metric arithmetic on float32 forecasts
+    future_production, future_co2, future_plastics_co2 = forecast_holt(Y, horizon).astype(np.float32)
+
+    # Derive the reduction metrics directly from the forecast arrays and build the predictions in one go
+    cumulative_reduction = np.cumsum(future_plastics_co2 - future_co2)
+    industries_count = 100
+    predictions = pd.DataFrame({
+        'Date': future_dates,
+        'Predicted Production (TPM)': future_production,
+        'Predicted CO2 Emissions (Material)': future_co2,
+        'Predicted CO2 Emissions (Plastics)': future_plastics_co2,
+        'CO2 per Ton (Material)': future_co2 / future_production,
+        'CO2 per Ton (Plastics)': future_plastics_co2 / future_production,
+        'Cumulative CO2 Reduction': cumulative_reduction,
+        'Total CO2 Reduction (100 Industries)': cumulative_reduction * industries_count,
+        'Plastic Avoided (100 Industries)': future_production * industries_count,
+    })
+
+    return predictions
+
 
 # Streamlit app
 st.set_page_config(layout="wide", page_title="Material Production and CO2 Emissions Forecast")
@@ -35,50 +179,13 @@ materials_db_file = st.sidebar.file_uploader("Upload Materials DB Excel File", t
 data_file = st.sidebar.file_uploader("Upload Production Data Excel File", type="xlsx")
 
 if materials_db_file and data_file:
-    materials_db = pd.ExcelFile(materials_db_file)
-    data = pd.ExcelFile(data_file)
-
-    # Verify sheet names
-    materials_sheet_names = materials_db.sheet_names
-
-    if 'Solids' in materials_sheet_names and 'Concentrates' in materials_sheet_names:
-        materials_solids = materials_db.parse('Solids')
-        materials_concentrates = materials_db.parse('Concentrates')
-    else:
-        st.error("Expected sheets 'Solids' and 'Concentrates' not found in the Materials DB file. Please check the file.")
-        st.stop()
-
-    production_sheet_names = data.sheet_names
-
-    if 'Production' in production_sheet_names:
-        production_data = data.parse('Production')
-    else:
-        st.error("Expected sheet 'Production' not found in the Production Data file. Please check the file.")
+    try:
+        material_diversity_summary = compute_diversity(materials_db_file.getvalue())
+        production, co2_emissions, plastics_co2_emissions = load_production(data_file.getvalue())
+    except ValueError as e:
+        st.error(str(e))
         st.stop()
 
-    # Analyze material diversity
-    solids_materials = materials_solids.iloc[3:, [1]].dropna().rename(columns={"Unnamed: 1": "Material"})
-    concentrates_materials = materials_concentrates.iloc[2:, [2]].dropna().rename(columns={"Unnamed: 2": "Material"})
-
-    solids_count = solids_materials["Material"].nunique()
-    concentrates_count = concentrates_materials["Material"].nunique()
-
-    all_materials = pd.concat([solids_materials, concentrates_materials], ignore_index=True)
-    all_materials_unique = all_materials["Material"].nunique()
-
-    overlap_count = len(set(solids_materials["Material"]).intersection(set(concentrates_materials["Material"])))
-    unique_solids = solids_count - overlap_count
-    unique_concentrates = concentrates_count - overlap_count
-
-    material_diversity_summary = {
-        "Unique Materials (Solids)": solids_count,
-        "Unique Materials (Concentrates)": concentrates_count,
-        "Total Unique Materials (Combined)": all_materials_unique,
-        "Overlapping Materials": overlap_count,
-        "Unique to Solids": unique_solids,
-        "Unique to Concentrates": unique_concentrates,
-    }
-
     # Layout for displaying results
     col1, col2 = st.columns(2)
 
@@ -88,125 +195,93 @@ if materials_db_file and data_file:
 
         # Visualize material diversity
         categories = ['Unique to Solids', 'Unique to Concentrates', 'Overlapping']
-        values = [unique_solids, unique_concentrates, overlap_count]
-
-        fig, ax = plt.subplots(figsize=(4, 4))
-        ax.pie(values, labels=categories, autopct='%1.1f%%', startangle=140, explode=(0.1, 0.1, 0), shadow=True)
-        ax.set_title("Material Diversity Across Solids and Concentrates", fontsize=12)
-        st.pyplot(fig)
+        values = [
+            material_diversity_summary["Unique to Solids"],
+            material_diversity_summary["Unique to Concentrates"],
+            material_diversity_summary["Overlapping Materials"],
+        ]
+
+        diversity = pd.DataFrame({
+            "Category": categories,
+            "Materials": values,
+            "Color": ['#0000ff', '#008000', '#808080'],
+        })
+        diversity["Share"] = diversity["Materials"] / diversity["Materials"].sum()
+        pie = alt.Chart(diversity, title="Material Diversity Across Solids and Concentrates").encode(
+            theta=alt.Theta("Materials:Q", stack=True),
+            color="Category:N",
+            tooltip=["Category", "Materials"],
+        )
+        percentages = pie.mark_text(radius=130).encode(text=alt.Text("Share:Q", format=".1%"))
+        st.altair_chart(pie.mark_arc(outerRadius=100) + percentages)
 
     with col2:
-        fig, ax = plt.subplots(figsize=(5, 4))
-        ax.bar(categories, values, color=['blue', 'green', 'gray'], alpha=0.7)
-        ax.set_title("Material Diversity Breakdown")
-        ax.set_ylabel("Values", fontsize=8, labelpad=10)
-        ax.set_xlabel("Material Categories", fontsize=8, labelpad=10)
-        ax.tick_params(axis='x', labelrotation=45, labelsize=8)
-        ax.grid(axis='y', linestyle='--', alpha=0.7)
-        st.pyplot(fig)
-
-    # Prepare production and CO2 data
-    production_data['Date'] = pd.to_datetime(production_data['Date'])
-    production_data.set_index('Date', inplace=True)
-    production = production_data['TPM'].replace([np.inf, -np.inf], np.nan).dropna()
-    co2_emissions = production_data['MyBC growth CO2 Produced Tons (1,6 kg per ton)'].replace([np.inf, -np.inf], np.nan).dropna()
-    plastics_co2_emissions = production_data['Plastic encineration(2.9kg CO2 per kg)'].replace([np.inf, -np.inf], np.nan).dropna()
-
-    # Ensure all series have the same length
-    min_length = min(len(production), len(co2_emissions), len(plastics_co2_emissions))
-    production = production.iloc[:min_length]
-    co2_emissions = co2_emissions.iloc[:min_length]
-    plastics_co2_emissions = plastics_co2_emissions.iloc[:min_length]
-
-    # Fit the data with Exponential Smoothing
-    warnings.filterwarnings("ignore", category=UserWarning)
-    warnings.filterwarnings("ignore", category=ConvergenceWarning)
-    try:
-        production_model = ExponentialSmoothing(production, trend='add', seasonal=None).fit()
-        co2_model = ExponentialSmoothing(co2_emissions, trend='add', seasonal=None).fit()
-        plastics_co2_model = ExponentialSmoothing(plastics_co2_emissions, trend='add', seasonal=None).fit()
-    except ValueError as ve:
-        st.error("Error in fitting the data with Exponential Smoothing: " + str(ve))
-        st.stop()
-    except ConvergenceWarning:
-        st.warning("Convergence issue detected during model fitting. Predictions might be suboptimal.")
+        st.markdown("**Material Diversity Breakdown**")
+        st.bar_chart(diversity, x="Category", y="Materials", color="Color", x_label="Material Categories", y_label="Values")
 
-    # Generate future predictions
+    # Fit the data with Exponential Smoothing and build the predictions (cached per uploaded file)
     future_steps = 24
-    future_dates = pd.date_range(start=production.index[-1], periods=future_steps + 1, freq='M')[1:]
-
-    future_production = production_model.forecast(future_steps)
-    future_co2 = co2_model.forecast(future_steps)
-    future_plastics_co2 = plastics_co2_model.forecast(future_steps)
-
-    # Create DataFrame for future predictions
-    predictions = pd.DataFrame({
-        'Date': future_dates,
-        'Predicted Production (TPM)': future_production.values,
-        'Predicted CO2 Emissions (Material)': future_co2.values,
-        'Predicted CO2 Emissions (Plastics)': future_plastics_co2.values
-    })
-
-    predictions['CO2 per Ton (Material)'] = predictions['Predicted CO2 Emissions (Material)'] / predictions['Predicted Production (TPM)']
-    predictions['CO2 per Ton (Plastics)'] = predictions['Predicted CO2 Emissions (Plastics)'] / predictions['Predicted Production (TPM)']
-    predictions['Cumulative CO2 Reduction'] = (
-        predictions['Predicted CO2 Emissions (Plastics)'] - predictions['Predicted CO2 Emissions (Material)']
-    ).cumsum()
-
-    industries_count = 100
-    predictions['Total CO2 Reduction (100 Industries)'] = predictions['Cumulative CO2 Reduction'] * industries_count
-    predictions['Plastic Avoided (100 Industries)'] = predictions['Predicted Production (TPM)'] * industries_count
+    try:
+        predictions = fit_and_forecast(data_file.getvalue(), future_steps)
+    except ValueError as e:
+        st.error("Error in fitting the data with Exponential Smoothing: " + str(e))
+        st.stop()
 
     st.subheader("Future Predictions")
     st.write(predictions)
 
     # Plot forecasts
     st.subheader("Production and CO2 Emissions Forecast")
-    fig, ax = plt.subplots(figsize=(6, 3))
-    ax.plot(production.index, production, label="Historical Production")
-    ax.plot(production.index, co2_emissions, label="Historical CO2 Emissions (Material)")
-    ax.plot(production.index, plastics_co2_emissions, label="Historical CO2 Emissions (Plastics)")
-    ax.plot(predictions['Date'], predictions['Predicted Production (TPM)'], label="Predicted Production", linestyle='--')
-    ax.plot(predictions['Date'], predictions['Predicted CO2 Emissions (Material)'], label="Predicted CO2 Emissions (Material)", linestyle='--')
-    ax.plot(predictions['Date'], predictions['Predicted CO2 Emissions (Plastics)'], label="Predicted CO2 Emissions (Plastics)", linestyle='--')
-    ax.set_xlabel("Date", fontsize=10, labelpad=10)
-    ax.set_ylabel("Values", fontsize=10, labelpad=20)
-    ax.set_title("Production and CO2 Emissions Forecast")
-    ax.legend()
-    ax.grid()
-    st.pyplot(fig)
+    series_names = ["Production", "CO2 Emissions (Material)", "CO2 Emissions (Plastics)"]
+    historical = pd.DataFrame(dict(zip(series_names, [production, co2_emissions, plastics_co2_emissions])))
+    forecast = predictions.set_index('Date')[[
+        'Predicted Production (TPM)', 'Predicted CO2 Emissions (Material)', 'Predicted CO2 Emissions (Plastics)'
+    ]].set_axis(series_names, axis=1)
+    # Long form so each series keeps one colour and the predicted part is drawn dashed
+    lines = (
+        pd.concat({"Historical": historical, "Predicted": forecast}, names=["Kind"])
+        .rename_axis(columns="Series")
+        .stack()
+        .rename("Value")
+        .reset_index()
+    )
+    forecast_chart = alt.Chart(lines, title="Production and CO2 Emissions Forecast").mark_line().encode(
+        x=alt.X("Date:T", title="Date"),
+        y=alt.Y("Value:Q", title="Values"),
+        color="Series:N",
+        strokeDash="Kind:N",
+        tooltip=["Date:T", "Series:N", "Kind:N", "Value:Q"],
+    )
+    st.altair_chart(forecast_chart)
 
     st.subheader("CO2 Emissions per Ton of Production")
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.plot(predictions['Date'], predictions['CO2 per Ton (Material)'], label="CO2 per Ton (Material)", linestyle='--')
-    ax.plot(predictions['Date'], predictions['CO2 per Ton (Plastics)'], label="CO2 per Ton (Plastics)", linestyle='--')
-    ax.set_xlabel("Date")
-    ax.set_ylabel("CO2 Emissions per Ton", fontsize=10, labelpad=10)
-    ax.set_title("CO2 Emissions per Ton of Production", fontsize=12)
-    ax.legend()
-    ax.grid()
-    st.pyplot(fig)
+    st.line_chart(
+        predictions,
+        x='Date',
+        y=['CO2 per Ton (Material)', 'CO2 per Ton (Plastics)'],
+        x_label="Date",
+        y_label="CO2 Emissions per Ton",
+    )
 
     st.subheader("CO2 Reduction Potential")
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.plot(predictions['Date'], predictions['Cumulative CO2 Reduction'], label="Cumulative CO2 Reduction Potential", linestyle='--', color='green')
-    ax.plot(predictions['Date'], predictions['Total CO2 Reduction (100 Industries)'], label="Total CO2 Reduction (100 Industries)", linestyle='--', color='red')
-    ax.set_xlabel("Date")
-    ax.set_ylabel("CO2 Reduction (Tons)", fontsize=10, labelpad=10)
-    ax.set_title("CO2 Reduction Potential by Scaling Material Production", fontsize=12)
-    ax.legend()
-    ax.grid()
-    st.pyplot(fig)
+    st.line_chart(
+        predictions,
+        x='Date',
+        y=['Cumulative CO2 Reduction', 'Total CO2 Reduction (100 Industries)'],
+        x_label="Date",
+        y_label="CO2 Reduction (Tons)",
+        color=['#008000', '#ff0000'],
+    )
 
     st.subheader("Plastic Avoidance by Scaling Material Production")
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(predictions['Date'], predictions['Plastic Avoided (100 Industries)'], label="Plastic Avoided (100 Industries)", linestyle='--', color='blue')
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Plastic Avoided (Tons)", fontsize=10, labelpad=10)
-    ax.set_title("Plastic Avoidance by Scaling Material Production", fontsize=12)
-    ax.legend()
-    ax.grid()
-    st.pyplot(fig)
+    st.line_chart(
+        predictions,
+        x='Date',
+        y='Plastic Avoided (100 Industries)',
+        x_label="Date",
+        y_label="Plastic Avoided (Tons)",
+        color='#0000ff',
+    )
 
     # Display recommendations
     st.subheader("Recommendations")